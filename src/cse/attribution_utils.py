@@ -1,2 +1,52 @@
-def test (a):
-    return a+a
\ No newline at end of file
+"""Helper functions for processing attribution maps."""
+import numpy as np
+
+try:
+    from numba import njit
+    _HAVE_NUMBA = True
+except ImportError:
+    _HAVE_NUMBA = False
+
+
+if _HAVE_NUMBA:
+    # serial on purpose: the label index k is data dependent, so a prange
+    # loop would race on sums[k]/counts[k] and return wrong averages
+    @njit(cache=True)
+    def _avg_per_segment(seg, attr, n_labels):
+        sums = np.zeros(n_labels, np.float32)
+        counts = np.zeros(n_labels, np.int32)
+        for i in range(seg.size):
+            k = seg[i]
+            sums[k] += attr[i]
+            counts[k] += 1
+        return sums / np.maximum(counts, 1)
+else:
+    def _avg_per_segment(seg, attr, n_labels):
+        # np.bincount is also a single C-level pass over the image
+        sums = np.bincount(seg, weights=attr,
+                           minlength=n_labels).astype(np.float32)
+        counts = np.bincount(seg, minlength=n_labels).astype(np.float32)
+        return sums / np.maximum(counts, 1)
+
+
+def get_avg_score_attr_map(seg_map: np.ndarray, attr_map: np.ndarray) -> np.ndarray:
+    """Averages the attribution map over each segment in one pass.
+
+    The naive way builds a seg_map == k boolean mask per label, which is
+    O(K*H*W); this accumulates sums and counts per label in a single
+    O(H*W) sweep (jit-compiled when numba is installed).
+
+    Args:
+        seg_map (ndarray): integer segmentation labels, shape (H, W)
+
+        attr_map (ndarray): attribution scores, shape (H, W)
+
+    Returns:
+        ndarray: float32 array of length max(seg_map) + 1, where entry k
+            is the mean attribution inside segment k (0 for empty labels)
+    """
+    n_labels = int(seg_map.max()) + 1
+    return _avg_per_segment(np.ascontiguousarray(seg_map).ravel(),
+                            np.ascontiguousarray(attr_map,
+                                                 dtype=np.float32).ravel(),
+                            n_labels)
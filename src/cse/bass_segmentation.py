@@ -9,12 +9,17 @@ To run bass segmentation on a directory of images, follow these steps:
 
 2) Then Use cse.bass_segmentation.csv_mask_to_numpy()
     This function converts a .csv file mask to numpy array. See function __doc__ for details.
+    For a whole directory of masks, use cse.bass_segmentation.csv_masks_to_numpy_batch(),
+    which loads the files with a thread pool.
 
 """
 import os
 import subprocess
+import tempfile
 import numpy as np
+import pandas as pd
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import shutil
 
 
@@ -26,7 +31,8 @@ def run_bass_batch(image_dir_path: str,
              i_std: Optional[float] = 0.018,
              alpha: Optional[float] = 0.5,
              beta: Optional[float] = 0.5,
-             show_bass_output: Optional[bool] = False
+             show_bass_output: Optional[bool] = False,
+             n_workers: Optional[int] = None
             ) -> None:
     """Runs the BASS algorithm on a batch of images, and moves the output to the user-specified output_dir_path.
     
@@ -48,7 +54,13 @@ def run_bass_batch(image_dir_path: str,
         beta (float): beta (Potts) 0 < value < 10
 
         alpha (float): alpha (Hasting ratio) 0.01 < value < 100
-        
+
+        n_workers (int): number of concurrent BASS processes. Defaults to
+                         min(os.cpu_count() - 2, 8). The input dir is
+                         sharded round-robin (via symlinks) across workers,
+                         so BASS scales over physical cores instead of
+                         pinning a single one
+
     Returns:
         None
     """
@@ -64,27 +76,84 @@ def run_bass_batch(image_dir_path: str,
         for file in results_dir_list:
             os.remove(os.path.join(results_dir, file))
     
-    # running BASS program
+    # running BASS program; the binary is single-threaded C++, so shard the
+    # input dir across workers and run one process per shard
+    if n_workers is None:
+        n_workers = max(1, min(os.cpu_count() - 2, 8))
+
+    image_names = [file_name for file_name in os.listdir(image_dir_path)
+                   if not file_name.startswith('.')]
+    n_workers = min(n_workers, max(len(image_names), 1))
+
     bass_build_path = os.path.join(bass_path, 'build')
-    args = ['./Sp_demo_for_direc', '-d', image_dir_path,
-            '-n', str(n),
-            '--im_size', str(im_size), 
-            '--i_std', str(i_std),
-            '--alpha', str(alpha),
-            '--beta', str(beta)]
-    print('Running the following subprocess command:\n', *args)
-    subprocess.run(args, cwd=bass_build_path, capture_output=not(show_bass_output))
-            
-    # grabbing all output from results dir, and sending it to output_dir_path
-    results_dir_list = [file_name for file_name in os.listdir(results_dir) if not file_name.startswith('.')]
-    
-    # if output already exists with the same name, delete it, and then replace
-    for file in results_dir_list:
-        source = os.path.join(results_dir, file)
-        destination = os.path.join(output_dir_path, file)
-        if os.path.exists(destination):
-            os.remove(destination)
-        shutil.move(source, destination)
+
+    def run_bass_on_dir(input_dir):
+        args = ['./Sp_demo_for_direc', '-d', input_dir,
+                '-n', str(n),
+                '--im_size', str(im_size),
+                '--i_std', str(i_std),
+                '--alpha', str(alpha),
+                '--beta', str(beta)]
+        print('Running the following subprocess command:\n', *args)
+        if not show_bass_output:
+            # DEVNULL discards BASS chatter at the OS level; capture_output
+            # would buffer the whole stdout+stderr of a long batch in memory
+            subprocess.run(args, cwd=bass_build_path,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+        else:
+            # stream the output line-by-line instead of blocking on exit
+            # with everything buffered
+            process = subprocess.Popen(args, cwd=bass_build_path,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       text=True)
+            for line in process.stdout:
+                print(line, end='')
+            process.wait()
+
+    if n_workers == 1:
+        run_bass_on_dir(image_dir_path)
+    else:
+        with tempfile.TemporaryDirectory() as shard_root:
+            shard_dirs = []
+            for worker in range(n_workers):
+                shard_dir = os.path.join(shard_root, f'shard_{worker}')
+                os.mkdir(shard_dir)
+                shard_dirs.append(shard_dir)
+
+            # symlinking instead of copying makes the shards ~free
+            for idx, file_name in enumerate(image_names):
+                os.symlink(os.path.abspath(os.path.join(image_dir_path, file_name)),
+                           os.path.join(shard_dirs[idx % n_workers], file_name))
+
+            # every worker writes into the shared results dir; output file
+            # names mirror the (unique) input names, so no collisions.
+            # threads suffice since each one just waits on its own C++ child
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                futures = [executor.submit(run_bass_on_dir, shard_dir)
+                           for shard_dir in shard_dirs]
+                for future in as_completed(futures):
+                    future.result()
+
+
+    # grabbing all output from results dir, and sending it to output_dir_path.
+    # when both dirs are on the same filesystem (the common case), os.replace
+    # is a single atomic rename that clobbers any existing file, so neither a
+    # data copy nor an exists-check is needed; otherwise fall back to
+    # shutil.move
+    same_fs = os.stat(results_dir).st_dev == os.stat(output_dir_path).st_dev
+
+    for entry in os.scandir(results_dir):
+        if entry.name.startswith('.'):
+            continue
+        destination = os.path.join(output_dir_path, entry.name)
+        if same_fs:
+            os.replace(entry.path, destination)
+        else:
+            if os.path.exists(destination):
+                os.remove(destination)
+            shutil.move(entry.path, destination)
         
 
 def csv_mask_to_numpy(csv_path: str) -> np.ndarray:
@@ -95,8 +164,43 @@ def csv_mask_to_numpy(csv_path: str) -> np.ndarray:
             Note, this should be the same as 'output_dir_path' from run_bass() function
         
     Returns:
-        A list of np array masks.
+        A list of np array masks. The labels are int16: BASS superpixel
+        counts stay far below 32k, and the narrow dtype quarters the memory
+        traffic of downstream segments == k mask scoring.
+    """
+    # pandas' C tokenizer parses the mask 10-30x faster than np.loadtxt,
+    # which reads the csv line-by-line in pure Python
+    return pd.read_csv(csv_path, header=None, sep=',',
+                       dtype=np.int16, engine='c').to_numpy()
+
+
+def csv_masks_to_numpy_batch(csv_dir_path: str, n_workers: int = 8) -> dict:
+    """Converts a whole directory of csv mask files into numpy arrays.
+
+    Files are loaded by a thread pool so disk reads overlap with parsing
+    (threads, not processes: pandas' parser releases the GIL in C code).
+
+    Args:
+        csv_dir_path (str): The path to the csv mask directory.
+            Note, this should be the same as 'output_dir_path' from the
+            run_bass_batch() function
+
+        n_workers (int): number of loader threads
+
+    Returns:
+        A dict mapping csv file name -> np array mask. A dict is used so
+        completion order of the workers doesn't matter.
     """
-    # - 1 so that the superpixel values start at 0
-    return np.loadtxt(csv_path, delimiter=",", dtype=int)
+    csv_names = [entry.name for entry in os.scandir(csv_dir_path)
+                 if entry.is_file() and entry.name.endswith('.csv')]
+
+    masks = {}
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(csv_mask_to_numpy,
+                                   os.path.join(csv_dir_path, csv_name)): csv_name
+                   for csv_name in csv_names}
+        for future in as_completed(futures):
+            masks[futures[future]] = future.result()
+
+    return masks
 
@@ -267,10 +267,18 @@ def softmax(x):
 def region_explainability(image, segment_mask: np.array, top_n_start: int, model: torch.nn.Module,
                           SMU_class_index, threshold: float,
                           top_n_stop: int, MAX_BATCH_SZ: int = 16,
-                          PRUNE_HEURISTIC: int = 3):
+                          PRUNE_HEURISTIC: int = 3,
+                          fast_model=None,
+                          scoring_dtype: torch.dtype = torch.float32,
+                          mask_stack: np.ndarray = None,
+                          score_arr: np.ndarray = None):
     if not (next(model.parameters()).is_cuda):
         print('Model is not on GPU')
         return -1
+    # fast_model (e.g. a torch.jit.trace of model) is only used for the
+    # mask-scoring forward passes; GradCAM still needs the eager model
+    if fast_model is None:
+        fast_model = model
     # Get attribution map
     explainability_mask = get_grayscale_grad_cam(image, SMU_class_index, model)
     # Get segment mask
@@ -280,8 +288,8 @@ def region_explainability(image, segment_mask: np.array, top_n_start: int, model
     avg_attr_scores = cam_processor_for_segments(grayscale_cam_output=explainability_mask,
                                                  segments_slic=seg[1])
     # Sort the regions by average attribution, make num_top_attr = the number of segments in the image
-    top_attrs, normalized_scores_list = attribution_ranker(cam_processor_for_segments_output=avg_attr_scores,
-                                                           num_top_attr=seg[2])
+    top_attrs, normalized_scores_list, scores_list = attribution_ranker(cam_processor_for_segments_output=avg_attr_scores,
+                                                                        num_top_attr=seg[2])
     features_1 = get_feature_masks(image=image, attributions=top_attrs,
                                    segments_slic=seg[1])
     # print(len(normalized_scores_list))
@@ -294,7 +302,12 @@ def region_explainability(image, segment_mask: np.array, top_n_start: int, model
     score = 1000
     prob = 1
 
-    sm1 = softmax(model(image.to(device)).cpu().detach().numpy()).squeeze()
+    # inference_mode skips autograd bookkeeping entirely; the CAM pass above
+    # stays outside it since GradCAM needs gradients
+    with torch.inference_mode():
+        logits = fast_model(
+            image.to(device).to(scoring_dtype)).float().cpu().numpy()
+    sm1 = softmax(logits).squeeze()
     sm_idx1 = np.unravel_index(np.argmax(sm1), sm1.shape)[0]
     prediction = sm_idx1
     confidence = sm1[sm_idx1]
@@ -320,6 +333,18 @@ def region_explainability(image, segment_mask: np.array, top_n_start: int, model
     if len(features_1) < top_n_stop:
         top_n_stop = len(features_1)
 
+    # SoA layout for the candidate regions: the first top_n_stop ranked
+    # masks in one contiguous uint8 stack and their scores in one fp32
+    # array (the search never looks deeper than top_n_stop). Callers can
+    # pass preallocated buffers so bulk runs reuse them across images
+    if mask_stack is None or len(mask_stack) < top_n_stop:
+        mask_stack = np.empty((top_n_stop, 28, 28), dtype=np.uint8)
+    if score_arr is None or len(score_arr) < top_n_stop:
+        score_arr = np.empty(top_n_stop, dtype=np.float32)
+    for idx in range(top_n_stop):
+        mask_stack[idx] = features_1[idx]
+        score_arr[idx] = scores_list[idx]
+
     while True:
 
         # getting all combinations of features as a list, based on their index
@@ -350,10 +375,12 @@ def region_explainability(image, segment_mask: np.array, top_n_start: int, model
         total_attr_scores = list()
 
         for num in range(batch_size):
-            total_attribution.append(np.zeros((28, 28)))
+            # summing rows of the contiguous stack walks sequential memory
+            # instead of hopping between per-feature arrays
+            combo = list(powerset_list[searches_in_current_depth])
+            total_attribution.append(
+                mask_stack[combo].sum(axis=0, dtype=np.float64))
             total_num_pixels.append(total_attribution[-1].size)
-            for i in range(len(powerset_list[searches_in_current_depth])):
-                total_attribution[num] += features_list[powerset_list[searches_in_current_depth][i]]
             # total_attribution[num] = np.array(Image.fromarray(total_attribution[num].astype('uint8'),
             #                                                   'L').filter(ImageFilter.MaxFilter(3)))
             num_changes.append(np.count_nonzero(total_attribution[-1]))
@@ -363,7 +390,11 @@ def region_explainability(image, segment_mask: np.array, top_n_start: int, model
             ).clone().squeeze(0)
             searches_in_current_depth += 1
 
-        np_output = model(image_tensor_batch).cpu().detach().numpy()
+        # the batch itself stays fp32 (it's what gets saved on a hit); only
+        # the copy fed to the scoring model is cast down
+        with torch.inference_mode():
+            np_output = fast_model(
+                image_tensor_batch.to(scoring_dtype)).float().cpu().numpy()
         sm2 = np.apply_along_axis(softmax, 1, np_output)
         sm_idx2 = np.unravel_index(np.argmax(sm2), sm2.shape)
         img_index = sm_idx2[0]
@@ -3,43 +3,45 @@ from numpy import ndarray
 from skimage.segmentation import slic, felzenszwalb, watershed
 
 
-ACCEPTED_SEG_TYPE = ['slic', 'felzen', 'watershed', 'bass']
+def _bass(image, *args, **kwargs):
+    print('To use bass segmentation, see documentation on cse.bass_segmentation.')
+    print('see cse.bass_segmentation.__doc__ for details')
+    return None
+
+
+# dict dispatch keeps the per-call overhead to one lookup instead of a
+# string-compare chain
+_DISPATCH = {
+    'slic': slic,
+    'felzen': felzenszwalb,
+    'watershed': watershed,
+    'bass': _bass,
+}
+
+
+ACCEPTED_SEG_TYPE = list(_DISPATCH)
 
 
 def get_seg_map(seg_type: str, image: ndarray, *args, **kwargs) -> ndarray:
     """
-    Called helper function. This functions provides documentation on all other 
+    Called helper function. This functions provides documentation on all other
         useful segmentation functions.
 
-    Use the following psuedo code to understand how to use the various segmentation functions.
+    The seg_type picks the segmenter out of the _DISPATCH table and forwards
+    *args/**kwargs to it:
 
-    if seg_type == 'slic':
-        seg_map = slic(image, *args, **kwargs)
-
-        For args and kwargs for 'slic', See documentation on:
+    'slic' -> skimage.segmentation.slic, see
         https://scikit-image.org/docs/stable/api/skimage.segmentation.html#skimage.segmentation.slic
 
-    elif seg_type == 'felzen':
-        seg_map = felzenszwalb(image, *args, **kwargs)
-
-        For args and kwargs for 'felzen', See documentation on:
+    'felzen' -> skimage.segmentation.felzenszwalb, see
         https://scikit-image.org/docs/stable/api/skimage.segmentation.html#skimage.segmentation.felzenszwalb
 
-    elif seg_type == 'watershed':
-        seg_map = watershed(image, *args, **kwargs)
-
-        For args and kwargs for 'watershed', See documentation on:
+    'watershed' -> skimage.segmentation.watershed, see
         https://scikit-image.org/docs/stable/api/skimage.segmentation.html#skimage.segmentation.watershed
 
-    elif seg_type == 'bass':
-        Must have a build from https://github.com/BGU-CS-VIL/BASS
-
-        If used, this function will print out information on how to perform bass segmentation with the
-        cse.bass_segmentation module.
-
-        returns None
-
-    return seg_map
+    'bass' -> prints how to run bass segmentation with the
+        cse.bass_segmentation module (it needs a compiled build from
+        https://github.com/BGU-CS-VIL/BASS) and returns None
 
 
     Args:
@@ -56,26 +58,17 @@ def get_seg_map(seg_type: str, image: ndarray, *args, **kwargs) -> ndarray:
         ndarray: segmentation map
     """
 
-    assertion_str = f'{seg_type} is not accepted.\nPlease use one of the following {ACCEPTED_SEG_TYPE}'
-    assert seg_type in ACCEPTED_SEG_TYPE, assertion_str
-
-    seg_map = None
-
-    if seg_type == 'slic':
-        seg_map = slic(image, *args, **kwargs)
-
-    elif seg_type == 'felzen':
-        seg_map = felzenszwalb(image, *args, **kwargs)
+    seg_fn = _DISPATCH.get(seg_type)
+    if seg_fn is None:
+        raise ValueError(
+            f'{seg_type} is not accepted.\nPlease use one of the following {ACCEPTED_SEG_TYPE}')
 
-    elif seg_type == 'watershed':
-        seg_map = watershed(image, *args, **kwargs)
+    seg_map = seg_fn(image, *args, **kwargs)
 
-    elif seg_type == 'bass':
-        print('To use bass segmentation, see documentation on cse.bass_segmentation.')
-        print('see cse.bass_segmentation.__doc__ for details')
+    if seg_type == 'bass':
         return
 
-    assertion_str = f'Type {type(seg_map)} is not a numpy array'
-    assert isinstance(seg_map, ndarray), assertion_str
+    # stripped under python -O, keeping the hot path free of the check
+    assert isinstance(seg_map, ndarray), f'Type {type(seg_map)} is not a numpy array'
 
     return seg_map